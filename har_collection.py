@@ -22,10 +22,17 @@ Author: Aditya Shenoy
 License: MIT
 """
 
+import os
+import pathlib
+import signal
 import subprocess
+import threading
 import time
+import traceback
+from collections import deque
 import pychrome
-import json
+import orjson
+import selectors
 import sys
 
 
@@ -42,19 +49,71 @@ def run_adb_command(command, device_id=None):
     if device_id:
         cmd += ["-s", device_id]
     cmd += command
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.stdout.strip()
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return result.stdout.decode("utf-8", "replace").strip()
 
 
-def open_chrome(url, device_id=None):
+class AdbSession:
+    """
+    A persistent `adb shell` session for a device.
+
+    Each one-shot adb invocation pays process spawn plus server handshake
+    overhead; piping commands through a single long-lived shell avoids that.
+    """
+
+    _SENTINEL = "__SIMBA_DONE__"
+
+    def __init__(self, device_id=None):
+        cmd = ["adb"]
+        if device_id:
+            cmd += ["-s", device_id]
+        cmd += ["shell"]
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+    def run(self, command):
+        """
+        Runs a shell command on the device through the open session.
+        Args:
+            command (str): Shell command line to execute.
+        Returns:
+            str: Output from the command, or a readable error if the session is dead.
+        """
+        lines = []
+        try:
+            self.proc.stdin.write(f"{command}; echo {self._SENTINEL}\n")
+            self.proc.stdin.flush()
+            for line in self.proc.stdout:
+                if line.strip() == self._SENTINEL:
+                    break
+                lines.append(line)
+        except (BrokenPipeError, OSError):
+            # The shell died (no device, unauthorized, adb missing); report instead of raising
+            lines.append(f"[ADB] shell session closed (exit code {self.proc.poll()}); is the device connected and authorized?")
+        return "".join(lines).strip()
+
+    def close(self):
+        """Ends the shell session and reaps the adb process."""
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+
+
+def open_chrome(url, adb):
     """
     Launches Chrome on the Android device with the specified URL.
     Args:
         url (str): The URL to open.
-        device_id (str, optional): Device serial number.
+        adb (AdbSession): Open shell session to the device.
     """
-    cmd = ["shell", "am", "start", "-a", "android.intent.action.VIEW", "-d", url, "com.android.chrome"]
-    output = run_adb_command(cmd, device_id)
+    output = adb.run(f"am start -a android.intent.action.VIEW -d '{url}' com.android.chrome")
     print(output)
 
 
@@ -67,9 +126,12 @@ def start_har_tracing(url, har_filename="chrome_har_output.json", capture_time=2
         capture_time (int): Duration to capture in seconds.
         device_id (str, optional): Device serial number.
     """
-    open_chrome(url, device_id)
+    adb = AdbSession(device_id)
+    open_chrome(url, adb)
     time.sleep(2)  # Wait for Chrome to launch
+    # `forward` is a host-side command, so it stays a one-shot invocation
     run_adb_command(["forward", "tcp:9222", "localabstract:chrome_devtools_remote"], device_id)
+    adb.close()
     time.sleep(1)  # Wait for port forwarding
 
     browser = pychrome.Browser(url="http://127.0.0.1:9222")
@@ -80,16 +142,32 @@ def start_har_tracing(url, har_filename="chrome_har_output.json", capture_time=2
     tab = tabs[0]
     tab.start()
     tab.Network.enable()
-    har = {"log": {"entries": []}}
+    # Stream entries straight to disk instead of buffering the whole HAR in memory.
+    # A 1 MiB buffer keeps bursts of entries from turning into many small write syscalls.
+    try:
+        f = open(har_filename, "wb", buffering=1024 * 1024)
+    except FileNotFoundError:
+        # Output directory doesn't exist yet; create it and retry
+        pathlib.Path(har_filename).parent.mkdir(parents=True, exist_ok=True)
+        f = open(har_filename, "wb", buffering=1024 * 1024)
+    try:
+        # Preallocate a rough upper bound (~100 KB/s of HAR) so the extents stay contiguous;
+        # capped at 64 MiB since long captures would otherwise reserve gigabytes of real
+        # blocks that only the truncate on the success path reclaims. Truncated back to
+        # the real size once tracing finishes.
+        os.posix_fallocate(f.fileno(), 0, min(capture_time * 100 * 1024, 64 * 1024 * 1024))
+    except (AttributeError, OSError):
+        pass
+    f.write(b'{"log":{"entries":[')
+    first = True
+    buf = deque()
 
     def request_will_be_sent(**kwargs):
-        # Capture each network request
-        har["log"]["entries"].append(kwargs)
+        # Just hand the event off; serialization and writing happen on the writer thread
+        buf.append(kwargs)
 
     tab.Network.requestWillBeSent = request_will_be_sent
 
-    import signal
-    import threading
     stop_event = threading.Event()
 
     def handle_sigterm(signum, frame):
@@ -98,51 +176,87 @@ def start_har_tracing(url, har_filename="chrome_har_output.json", capture_time=2
 
     signal.signal(signal.SIGTERM, handle_sigterm)
 
+    def check_stdin():
+        """Reads one line from stdin and stops tracing on a 'STOP' command."""
+        line = sys.stdin.readline()
+        if line:
+            print(f"[HAR TRACE] Received from stdin: {line.strip()}")
+            if line.strip() == "STOP":
+                print("[HAR TRACE] STOP command received via stdin.")
+                stop_event.set()
+
     def stdin_listener():
-        """Listens for 'STOP' command from stdin to end tracing early."""
+        """Windows fallback: stdin is not selectable there, so poll it from a thread."""
         print("[HAR TRACE] stdin listener thread started.")
         while not stop_event.is_set():
             try:
-                line = sys.stdin.readline()
-                if line:
-                    print(f"[HAR TRACE] Received from stdin: {line.strip()}")
-                    if line.strip() == "STOP":
-                        print("[HAR TRACE] STOP command received via stdin.")
-                        stop_event.set()
-                        break
+                check_stdin()
             except Exception as e:
                 print(f"[HAR TRACE] Exception in stdin listener: {e}")
                 break
 
-    def timer_thread():
-        """Ends tracing after the specified capture_time."""
-        print(f"[HAR TRACE] Timer thread started for {capture_time} seconds.")
-        time.sleep(capture_time)
-        print("[HAR TRACE] Timer expired, stopping trace.")
-        stop_event.set()
+    deadline = time.monotonic() + capture_time
+
+    def check_deadline():
+        """Ends tracing once capture_time has elapsed."""
+        if time.monotonic() >= deadline:
+            print("[HAR TRACE] Timer expired, stopping trace.")
+            stop_event.set()
 
-    t_timer = threading.Thread(target=timer_thread)
-    t_stdin = threading.Thread(target=stdin_listener)
-    t_timer.start()
-    t_stdin.start()
+    # Events can still arrive between stop_event being set and tab.stop() returning,
+    # so the writer shuts down on its own flag, set only after the producer has stopped
+    producer_done = threading.Event()
+
+    def writer_thread():
+        """Drains queued events to the HAR file until the producer stops and the queue is empty."""
+        nonlocal first
+        while not producer_done.is_set() or buf:
+            try:
+                entry = buf.popleft()
+            except IndexError:
+                time.sleep(0.005)
+                continue
+            if not first:
+                f.write(b",")
+            f.write(orjson.dumps(entry))
+            first = False
+
+    t_writer = threading.Thread(target=writer_thread)
+    t_writer.start()
+    # stdin can't be passed to select() on Windows, so keep the listener thread there
+    use_stdin_thread = sys.platform == "win32"
+    if use_stdin_thread:
+        t_stdin = threading.Thread(target=stdin_listener)
+        t_stdin.start()
 
     print(f"HAR tracing started for up to {capture_time} seconds. Interact with the page. Use Stop button to end early.")
     try:
-        while not stop_event.is_set():
-            time.sleep(1)
+        if use_stdin_thread:
+            while not stop_event.is_set():
+                stop_event.wait(timeout=0.5)
+                check_deadline()
+        else:
+            sel = selectors.DefaultSelector()
+            sel.register(sys.stdin, selectors.EVENT_READ)
+            while not stop_event.is_set():
+                if sel.select(timeout=0.5):
+                    check_stdin()
+                check_deadline()
+            sel.close()
     except KeyboardInterrupt:
         print("KeyboardInterrupt received, stopping HAR trace...")
         stop_event.set()
 
     tab.stop()
-    # Save HAR file to disk
+    # Let the writer drain any remaining entries, then close out the HAR structure
+    producer_done.set()
+    t_writer.join()
     try:
-        with open(har_filename, "w", encoding="utf-8") as f:
-            json.dump(har, f, indent=2)
-            f.flush()
+        f.write(b"]}}")
+        f.truncate()
+        f.close()
         print(f"[HAR TRACE] HAR file saved: {har_filename}")
     except Exception as e:
-        import traceback
         print(f"[HAR TRACE] ERROR saving HAR file: {e}")
         traceback.print_exc()
     print("You can now download or move this file to your local machine.")
@@ -150,14 +264,12 @@ def start_har_tracing(url, har_filename="chrome_har_output.json", capture_time=2
 
 
 if __name__ == "__main__":
-    import os
     # Parse command-line arguments with defaults
     url = sys.argv[1] if len(sys.argv) > 1 else "https://www.google.com"
     har_filename = sys.argv[2] if len(sys.argv) > 2 else "chrome_har_output.har"
     capture_time = int(sys.argv[3]) if len(sys.argv) > 3 else 100
     device_id = sys.argv[4] if len(sys.argv) > 4 else None
-    # Always save to output/har_files/
-    har_dir = os.path.join(os.getcwd(), "output", "har_files")
-    os.makedirs(har_dir, exist_ok=True)
-    har_filename = os.path.join(har_dir, os.path.basename(har_filename))
+    # Always save to output/har_files/; the directory is created lazily on first open
+    har_dir = pathlib.Path(os.getcwd(), "output", "har_files")
+    har_filename = str(har_dir / os.path.basename(har_filename))
     start_har_tracing(url, har_filename, capture_time, device_id)
\ No newline at end of file